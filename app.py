@@ -1,30 +1,41 @@
-import base64
+import hashlib
 import html
+import io
 import json
 import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import streamlit as st
 from dotenv import load_dotenv
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from PIL import Image, UnidentifiedImageError
+
+try:
+    # orjson parses in C and is a faster drop-in for json.loads (optional dependency)
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
 
 from mock_data import get_default_data, get_mock_data
 from ui_components import (
     render_card,
+    render_styles,
     render_system_status,
     render_tool_action,
     render_triage_badge,
 )
-from utils import (
-    extract_data_from_image,
-    preprocess_tabular_data,
-    preprocess_timeseries_data,
-    run_triage_agent,
-    _extract_outputs_with_gemini,
-    _generate_report_fast,
-)
 
 
 load_dotenv()
 
+# Streamlit re-runs the whole script (load_dotenv included) on every
+# interaction, so this is re-evaluated each run; it is a single environment
+# lookup, shared by every key check below
+_API_KEY_PRESENT = bool(os.getenv("GEMINI_API_KEY"))
+
 st.set_page_config(
     page_title="MCTA · Multimodal Clinical Triage Agent",
     page_icon="🩺",
@@ -32,7 +43,7 @@ st.set_page_config(
     initial_sidebar_state="collapsed",
 )
 
-st.markdown(
+st.html(
     """
     <style>
     body {
@@ -44,9 +55,9 @@ st.markdown(
         padding-bottom: 1.5rem;
     }
     </style>
-    """,
-    unsafe_allow_html=True,
+    """
 )
+render_styles()
 
 
 if "chat_history" not in st.session_state:
@@ -65,53 +76,142 @@ if "raw_json_response" not in st.session_state:
     st.session_state.raw_json_response = None
 
 # Initialize patient data with default healthy values
-if "patient_labs" not in st.session_state:
+if "patient_labs" not in st.session_state or "patient_vitals" not in st.session_state:
     default_data = get_default_data()
-    st.session_state.patient_labs = default_data["labs"]
+    st.session_state.setdefault("patient_labs", default_data["labs"])
+    st.session_state.setdefault("patient_vitals", default_data["vitals"])
+
+# Set whenever image extraction writes lab values into patient_labs
+if "patient_labs_dirty" not in st.session_state:
+    st.session_state.patient_labs_dirty = False
+
+
+# MIME lookups for uploaded images (anything unrecognised is sent as JPEG)
+_MIME_BY_TYPE = {
+    "image/jpeg": "image/jpeg",
+    "image/jpg": "image/jpeg",
+    "image/png": "image/png",
+}
+_MIME_BY_EXT = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+}
+
+# tool_verification_data keys under which the model reports a risk score
+_RISK_KEYS = frozenset({
+    "sepsis_risk",
+    "risk_score",
+    "calculate_sepsis_risk",
+    "qsofa_score",
+    "news2_score",
+    "mews_score",
+})
+
+# Chat history bubbles (static CSS baked in; only the escaped message is substituted)
+_USER_MSG_TMPL = (
+    '<div style="text-align: right; background-color: #E5E7EB; padding: 0.5rem 0.75rem; '
+    'border-radius: 0.5rem; margin-bottom: 0.3rem; display: inline-block; max-width: 100%; '
+    'color: #1F2937;">%s</div>'
+)
+_ASSISTANT_MSG_TMPL = (
+    '<div style="text-align: left; background-color: #ECFEFF; border-left: 4px solid #0D9488; '
+    'padding: 0.5rem 0.75rem; border-radius: 0.5rem; margin-bottom: 0.3rem; max-width: 100%; '
+    'color: #1F2937;">🧑‍⚕️ %s</div>'
+)
+_EVIDENCE_TMPL = (
+    '<div style="background-color: #F9FAFB; padding: 1rem; border-radius: 0.5rem; '
+    'border-left: 4px solid #0D9488; font-size: 0.9rem; line-height: 1.6; color: #1F2937;">'
+    '%s</div>'
+)
+
+# Filename keywords that mark an upload as an X-ray/scan rather than a lab/vitals report
+_XRAY_RE = re.compile(r"x-?ray|scan|ct|mri|radiology|chest|lung")
 
-if "patient_vitals" not in st.session_state:
-    default_data = get_default_data()
-    st.session_state.patient_vitals = default_data["vitals"]
 
+def _detect_image_mime(file_name: str, file_type: str) -> str:
+    """
+    Detect the MIME type of an upload from its reported type, falling back to
+    the file extension (anything unrecognised is sent as JPEG).
+    """
+    return _MIME_BY_TYPE.get(file_type.lower()) or _MIME_BY_EXT.get(
+        os.path.splitext(file_name)[1].lower(), "image/jpeg"
+    )
 
-def encode_uploaded_image(file) -> tuple[str, str] | None:
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _thumbnail(file_bytes: bytes) -> bytes | None:
     """
-    Encode Streamlit uploaded file to base64 and detect MIME type.
+    Downscale an uploaded image to a small JPEG preview.
+
+    Cached so reruns reuse the preview instead of re-decoding and re-sending
+    the full-resolution upload to the browser. Returns None for a corrupt or
+    truncated upload, which then simply gets no preview.
+    """
+    try:
+        with Image.open(io.BytesIO(file_bytes)) as img:
+            img.thumbnail((320, 320), Image.Resampling.LANCZOS)
+            buf = io.BytesIO()
+            img.convert("RGB").save(buf, format="JPEG", quality=85)
+    except (UnidentifiedImageError, OSError):
+        return None
+    return buf.getvalue()
+
+
+class _UncachedExtraction(Exception):
+    """Carries a failed extraction result out of the cache (st.cache_data never caches raises)."""
+    def __init__(self, result):
+        super().__init__("image extraction failed")
+        self.result = result
+
+
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def _extract_data_cached(images: tuple[tuple[bytes, str], ...]):
+    from utils import extract_data_from_images
+
+    result = extract_data_from_images(list(images))
+    if result[2] is None:
+        # Don't pin a transient Gemini failure in the cache for an hour
+        raise _UncachedExtraction(result)
+    return result
+
+
+def extract_images_data(images: list[tuple[bytes, str]]):
+    """
+    Cached wrapper around extract_data_from_images keyed by image content.
+    
+    All images in the list go to Gemini in one multi-part request. Re-running
+    triage with the same uploads (e.g. while editing the notes) reuses the
+    previous extraction instead of calling Gemini again.
+    """
+    try:
+        return _extract_data_cached(tuple(images))
+    except _UncachedExtraction as e:
+        return e.result
+
+
+def read_uploaded_image(file) -> tuple[bytes, str] | None:
+    """
+    Read the raw bytes of a Streamlit uploaded file and detect its MIME type.
+    
+    The bytes are handed to Gemini as-is; the SDK does its own encoding when it
+    serializes the request, so no base64 copy is materialized here.
     
     Returns:
-        Tuple of (base64_string, mime_type) or None if no file.
+        Tuple of (image_bytes, mime_type) or None if no file.
     """
     if file is None:
         return None
     
-    # Detect MIME type from file extension/type
-    file_type = file.type.lower() if hasattr(file, "type") else ""
-    if "jpeg" in file_type or "jpg" in file_type:
-        mime_type = "image/jpeg"
-    elif "png" in file_type:
-        mime_type = "image/png"
-    else:
-        # Fallback: try to infer from filename
-        name_lower = file.name.lower() if hasattr(file, "name") else ""
-        if name_lower.endswith((".jpg", ".jpeg")):
-            mime_type = "image/jpeg"
-        elif name_lower.endswith(".png"):
-            mime_type = "image/png"
-        else:
-            mime_type = "image/jpeg"  # Default fallback
-    
-    # Read file bytes and encode to base64
-    file.seek(0)  # Reset file pointer
-    data = file.read()
-    base64_data = base64.b64encode(data).decode("utf-8")
-    
-    return (base64_data, mime_type)
+    # getvalue() returns the full contents without touching the file pointer
+    file_type = file.type if hasattr(file, "type") and file.type else ""
+    file_name = file.name if hasattr(file, "name") and file.name else ""
+    return file.getvalue(), _detect_image_mime(file_name, file_type)
 
 
 def main():
     st.title("🩺 Multimodal Clinical Triage Agent (MCTA)")
-    api_key_present = bool(os.getenv("GEMINI_API_KEY"))
-    if not api_key_present:
+    if not _API_KEY_PRESENT:
         st.warning(
             "GEMINI_API_KEY is not configured. Set it in a .env file or your environment "
             "to enable live triage calls.",
@@ -153,7 +253,11 @@ def main():
         image_cols = st.columns(min(len(uploaded_images), 3))
         for idx, img in enumerate(uploaded_images):
             with image_cols[idx % 3]:
-                st.image(img, caption=img.name)
+                preview = _thumbnail(img.getvalue())
+                if preview is not None:
+                    st.image(preview, caption=img.name)
+                else:
+                    st.caption(f"⚠️ No preview available for {img.name}")
     
     # Info message
     st.info(
@@ -176,7 +280,7 @@ def main():
     )
     
     if run_clicked:
-        if not api_key_present:
+        if not _API_KEY_PRESENT:
             st.error(
                 "Cannot run triage without GEMINI_API_KEY configured.",
                 icon="⛔",
@@ -187,77 +291,112 @@ def main():
                 icon="📝",
             )
         else:
-            # Validate and process uploaded images
+            # utils pulls in google-genai; import it only once a
+            # triage run is requested so the first page render stays fast
+            from utils import (
+                _extract_outputs_with_gemini,
+                _generate_report_fast,
+                preprocess_tabular_data,
+                preprocess_timeseries_data,
+            )
+            from config import report_schema_errors
+            
+            # Validate, classify and read uploaded images in a single pass
             xray_image = None
-            xray_b64 = None
+            xray_bytes = None
             xray_mime = None
             
-            # Separate images: X-ray/scan vs lab/vitals reports
-            lab_vitals_images = []
+            # Separate images: X-ray/scan vs lab/vitals reports.
+            # Images are read here (main thread) so the Gemini calls below only
+            # do network I/O.
+            lab_vitals_payloads = []
+            # Content digests of lab/vitals images already queued, so an image
+            # uploaded twice is only sent to Gemini once
+            seen_lab_vitals = set()
             
-            if uploaded_images:
-                for img in uploaded_images:
-                    file_type = img.type.lower() if hasattr(img, "type") else ""
-                    file_name = img.name.lower() if hasattr(img, "name") else ""
-                    
-                    # Check for valid image types
-                    valid_types = ["image/jpeg", "image/jpg", "image/png"]
-                    valid_extensions = [".jpg", ".jpeg", ".png"]
-                    
-                    is_valid_type = any(vt in file_type for vt in valid_types)
-                    is_valid_extension = any(ve in file_name for ve in valid_extensions)
-                    
-                    if not (is_valid_type or is_valid_extension):
-                        st.warning(
-                            f"⚠️ Invalid image file type for {img.name}. Skipping.",
-                            icon="⚠️",
-                        )
+            for img in uploaded_images or []:
+                file_type = (getattr(img, "type", None) or "").lower()
+                file_name = (getattr(img, "name", None) or "").lower()
+                
+                # Check for valid image types
+                is_valid_type = file_type in _MIME_BY_TYPE
+                is_valid_extension = os.path.splitext(file_name)[1] in _MIME_BY_EXT
+                
+                if not (is_valid_type or is_valid_extension):
+                    st.warning(
+                        f"⚠️ Invalid image file type for {img.name}. Skipping.",
+                        icon="⚠️",
+                    )
+                    continue
+                
+                # Heuristic: Check filename to determine if it's X-ray/scan or lab/vitals
+                # X-ray/scan keywords: xray, x-ray, scan, ct, mri, radiology
+                # Lab/vitals keywords: lab, report, vitals, chart, blood
+                is_xray = _XRAY_RE.search(file_name) is not None
+                if is_xray and xray_image is not None:
+                    continue  # Only the first X-ray/scan found is used
+                
+                img_data = read_uploaded_image(img)
+                if is_xray:
+                    # This is likely an X-ray/scan image
+                    xray_image = img
+                    if img_data:
+                        xray_bytes, xray_mime = img_data
+                elif img_data:
+                    # This is likely a lab report or vitals chart
+                    digest = hashlib.blake2b(img_data[0], digest_size=16).digest()
+                    if digest in seen_lab_vitals:
+                        print(f"  ℹ️  Skipping duplicate image: {img.name}", file=sys.stderr)
                         continue
-                    
-                    # Heuristic: Check filename/type to determine if it's X-ray/scan or lab/vitals
-                    # X-ray/scan keywords: xray, x-ray, scan, ct, mri, radiology
-                    # Lab/vitals keywords: lab, report, vitals, chart, blood
-                    name_lower = file_name
-                    if any(keyword in name_lower for keyword in ["xray", "x-ray", "scan", "ct", "mri", "radiology", "chest", "lung"]):
-                        # This is likely an X-ray/scan image
-                        if xray_image is None:  # Use first X-ray/scan found
-                            xray_image = img
-                            img_data = encode_uploaded_image(img)
-                            if img_data:
-                                xray_b64, xray_mime = img_data
-                    else:
-                        # This is likely a lab report or vitals chart
-                        lab_vitals_images.append(img)
+                    seen_lab_vitals.add(digest)
+                    lab_vitals_payloads.append((img, *img_data))
+                else:
+                    st.warning(f"⚠️ Could not read image: {img.name}")
+                    print(f"  ❌ Failed to read image: {img.name}", file=sys.stderr)
             
             # Initialize image analyses list
             all_image_analyses = []
             
-            # Analyze X-ray/scan images with Gemini
-            if xray_image and api_key_present:
-                with st.spinner("Analyzing X-ray/scan image with Gemini 2.5 Pro..."):
-                    import sys
-                    print(f"📸 Analyzing X-ray/scan image: {xray_image.name}", file=sys.stderr)
-                    _, _, xray_analysis, _ = extract_data_from_image(xray_b64, xray_mime)
-                    if xray_analysis:
-                        all_image_analyses.append(xray_analysis)
-                        print(f"  ✅ X-ray analysis complete ({len(xray_analysis)} chars)", file=sys.stderr)
-            
-            # Extract data from lab/vitals images automatically
-            if lab_vitals_images and api_key_present:
-                with st.spinner("Extracting lab values and vitals from images using Gemini 2.5 Pro..."):
-                    import sys
-                    print(f"📸 Processing {len(lab_vitals_images)} image(s) for data extraction...", file=sys.stderr)
+            # Analyze the X-ray/scan and extract data from lab/vitals images concurrently.
+            # All lab/vitals images go out as one multi-part request (so pages of the
+            # same report are read together), and the X-ray runs alongside it, so
+            # wall-clock time is roughly the slower of the two calls.
+            if _API_KEY_PRESENT and (xray_bytes or lab_vitals_payloads):
+                with st.spinner("Analyzing uploaded images with Gemini 2.5 Pro..."):
+                    num_tasks = (1 if lab_vitals_payloads else 0) + (1 if xray_bytes else 0)
+                    print(f"📸 Processing uploaded images in {num_tasks} concurrent request(s)...", file=sys.stderr)
                     
-                    for img in lab_vitals_images:
-                        print(f"  📄 Analyzing: {img.name}", file=sys.stderr)
-                        img_data = encode_uploaded_image(img)
-                        if img_data:
-                            img_b64, img_mime = img_data
-                            
-                            # Extract data and get Gemini's analysis
-                            extracted_labs, extracted_vitals, image_analysis, extraction_errors = extract_data_from_image(
-                                img_b64, img_mime
+                    # The workers call st.cache_data functions, which need this
+                    # script run's context (otherwise every run logs "missing
+                    # ScriptRunContext" warnings)
+                    with ThreadPoolExecutor(
+                        max_workers=num_tasks,
+                        initializer=add_script_run_ctx,
+                        initargs=(None, get_script_run_ctx()),
+                    ) as executor:
+                        xray_future = None
+                        if xray_bytes:
+                            print(f"📸 Analyzing X-ray/scan image: {xray_image.name}", file=sys.stderr)
+                            xray_future = executor.submit(extract_images_data, [(xray_bytes, xray_mime)])
+                        lab_vitals_future = None
+                        if lab_vitals_payloads:
+                            lab_vitals_names = ", ".join(img.name for img, _, _ in lab_vitals_payloads)
+                            print(f"  📄 Analyzing: {lab_vitals_names}", file=sys.stderr)
+                            lab_vitals_future = executor.submit(
+                                extract_images_data,
+                                [(img_bytes, img_mime) for _, img_bytes, img_mime in lab_vitals_payloads],
                             )
+                        
+                        # Streamlit calls must happen on this thread, not in the workers.
+                        if xray_future is not None:
+                            _, _, xray_analysis, _ = xray_future.result()
+                            if xray_analysis:
+                                all_image_analyses.append(xray_analysis)
+                                print(f"  ✅ X-ray analysis complete ({len(xray_analysis)} chars)", file=sys.stderr)
+                        
+                        if lab_vitals_future is not None:
+                            # Extract data and get Gemini's analysis
+                            extracted_labs, extracted_vitals, image_analysis, extraction_errors = lab_vitals_future.result()
                             
                             # Store image analysis for later use
                             if image_analysis:
@@ -265,29 +404,30 @@ def main():
                             
                             if extraction_errors:
                                 for err in extraction_errors:
-                                    st.warning(f"⚠️ Extraction warning for {img.name}: {err}")
+                                    st.warning(f"⚠️ Extraction warning for {lab_vitals_names}: {err}")
                                     print(f"  ⚠️  {err}", file=sys.stderr)
                             
                             # Update session state with extracted data
                             if extracted_labs:
                                 print(f"  ✅ Successfully extracted lab values: {extracted_labs}", file=sys.stderr)
+                                if not st.session_state.patient_labs_dirty:
+                                    # First extraction replaces the default panel instead of merging into it
+                                    st.session_state.patient_labs = {}
                                 for key, value in extracted_labs.items():
                                     if value is not None:
                                         st.session_state.patient_labs[key] = value
-                                st.success(f"✅ Extracted lab values from {img.name}")
+                                st.session_state.patient_labs_dirty = True
+                                st.success(f"✅ Extracted lab values from {lab_vitals_names}")
                             else:
-                                print(f"  ℹ️  No lab values found in {img.name}", file=sys.stderr)
+                                print(f"  ℹ️  No lab values found in {lab_vitals_names}", file=sys.stderr)
                             
                             if extracted_vitals:
                                 print(f"  ✅ Successfully extracted {len(extracted_vitals)} vitals measurements", file=sys.stderr)
                                 # Replace vitals with extracted data (don't merge with defaults)
                                 st.session_state.patient_vitals = extracted_vitals
-                                st.success(f"✅ Extracted {len(extracted_vitals)} vitals measurements from {img.name}")
+                                st.success(f"✅ Extracted {len(extracted_vitals)} vitals measurements from {lab_vitals_names}")
                             else:
-                                print(f"  ℹ️  No vitals data found in {img.name}", file=sys.stderr)
-                        else:
-                            st.warning(f"⚠️ Could not encode image: {img.name}")
-                            print(f"  ❌ Failed to encode image: {img.name}", file=sys.stderr)
+                                print(f"  ℹ️  No vitals data found in {lab_vitals_names}", file=sys.stderr)
             
             # Proceed with execution
             st.session_state.chat_history = []
@@ -302,12 +442,17 @@ def main():
 
             # Use ONLY extracted data from images - no defaults
             # Only use labs/vitals if they were actually extracted from images
-            labs_json = st.session_state.patient_labs if st.session_state.patient_labs else None
+            # (patient_labs starts out holding the default panel)
+            labs_json = (
+                st.session_state.patient_labs
+                if st.session_state.patient_labs and st.session_state.patient_labs_dirty
+                else None
+            )
             vitals_list = st.session_state.patient_vitals if st.session_state.patient_vitals else None
             
             # Pre-process data ONLY if we have actual data (not empty dicts/lists)
             try:
-                if labs_json and isinstance(labs_json, dict) and any(v is not None and v != 0 for v in labs_json.values()):
+                if labs_json:
                     tabular_summary = preprocess_tabular_data(labs_json)
                 else:
                     tabular_summary = "Tabular Data Feature: No lab data extracted from images."
@@ -331,7 +476,6 @@ def main():
             status_placeholder.info("🔍 **Status: Examining patient data...**")
             
             with st.spinner("Running MCTA triage agent..."):
-                import sys
                 print("\n" + "="*60, file=sys.stderr)
                 print("MCTA: Starting triage analysis...", file=sys.stderr)
                 print("="*60, file=sys.stderr)
@@ -346,19 +490,31 @@ def main():
                     print(f"📄 Combined image analysis ({len(combined_image_analysis)} chars) will be included in prompt", file=sys.stderr)
                 
                 # OPTIMIZATION: Use fast path for speed (direct Gemini call)
-                import time
                 start_time = time.time()
                 print("⚡ Using fast Gemini extraction path for speed...", file=sys.stderr)
                 status_placeholder.info("⚡ **Status: Fast analysis mode...**")
                 
+                # Show the draft diagnoses while the report is still streaming in
+                shown_draft = [None]
+                
+                def show_partial_report(partial: dict) -> None:
+                    diagnoses = partial.get("differential_diagnosis")
+                    if not isinstance(diagnoses, list) or not diagnoses:
+                        return
+                    draft = ", ".join(str(d) for d in diagnoses)
+                    if draft != shown_draft[0]:
+                        shown_draft[0] = draft
+                        status_placeholder.info(f"⚡ **Status: Drafting report...** {draft}")
+                
                 report, raw_json_text, tool_logs, errors = _generate_report_fast(
                     notes,
-                    xray_b64,
+                    xray_bytes,
                     xray_mime,
                     labs_json,
                     vitals_list,
                     combined_image_analysis,
                     st.session_state.get("preprocessed_summaries", {}),
+                    on_partial_report=show_partial_report,
                 )
                 
                 elapsed = time.time() - start_time
@@ -376,9 +532,11 @@ def main():
             st.session_state.raw_json_response = raw_json_text
 
             # Debug: Print report status and try to recover if report is None
-            import sys
             if report:
                 print(f"✅ Report received: {type(report)}, keys: {list(report.keys()) if isinstance(report, dict) else 'N/A'}", file=sys.stderr)
+                # Non-conforming reports are still shown; the fallback below fills gaps
+                for schema_err in report_schema_errors(report):
+                    print(f"⚠️  Report does not match DIAGNOSTIC_REPORT_SCHEMA: {schema_err}", file=sys.stderr)
                 st.session_state.diagnostic_report = report
             else:
                 print(f"❌ No report received. raw_json_text length: {len(raw_json_text) if raw_json_text else 0}", file=sys.stderr)
@@ -386,9 +544,8 @@ def main():
                 # Try to create a report from raw_json_text if available
                 if raw_json_text:
                     try:
-                        import json
                         # Try to parse the raw JSON
-                        parsed = json.loads(raw_json_text)
+                        parsed = _json_loads(raw_json_text)
                         if isinstance(parsed, dict):
                             st.session_state.diagnostic_report = parsed
                             print(f"✅ Successfully parsed raw_json_text into report", file=sys.stderr)
@@ -401,19 +558,16 @@ def main():
             tool_data = report.get("tool_verification_data") or {}
             has_risk_score = False
             if isinstance(tool_data, dict):
-                has_risk_score = (
-                    tool_data.get("sepsis_risk") is not None or
-                    tool_data.get("risk_score") is not None or
-                    tool_data.get("calculate_sepsis_risk") is not None
-                )
+                # Accept any of the names the model uses for a risk score
+                has_risk_score = any(tool_data.get(k) is not None for k in _RISK_KEYS)
             
-            if not st.session_state.diagnostic_report or not st.session_state.diagnostic_report.get("differential_diagnosis") or not has_risk_score:
+            if not report.get("differential_diagnosis") or not has_risk_score:
                 print("🔄 Using Gemini fallback to extract diagnosis, reasoning, and risk score...", file=sys.stderr)
                 fallback_results = _extract_outputs_with_gemini(
                     raw_json_text or "",
                     st.session_state.get("preprocessed_summaries", {}),
                     tool_logs,
-                    st.session_state.get("patient_labs", {}),
+                    labs_json,
                     st.session_state.get("patient_vitals", []),
                 )
                 if fallback_results:
@@ -436,6 +590,17 @@ def main():
             # Only do this if we have a report
             if st.session_state.diagnostic_report:
                 report_for_viz = st.session_state.diagnostic_report
+                
+                # Fill a missing evidence_summary from the per-diagnosis reasoning once
+                # here, so the render code below doesn't rebuild it on every rerun
+                if not report_for_viz.get("evidence_summary"):
+                    reasoning_parts = [
+                        reasoning
+                        for d in report_for_viz.get("differential_diagnosis") or []
+                        if isinstance(d, dict) and (reasoning := d.get("reasoning", d.get("reason", "")))
+                    ]
+                    if reasoning_parts:
+                        report_for_viz["evidence_summary"] = " ".join(reasoning_parts)
                 # The model may store it under various keys (visualization_base64, base64_image, etc.)
                 tvd = report_for_viz.get("tool_verification_data") or {}
                 
@@ -513,42 +678,8 @@ def main():
     reasoning_container = st.container()
     with reasoning_container:
         for msg in st.session_state.chat_history:
-            if msg["role"] == "user":
-                st.markdown(
-                    f"""
-                    <div style="
-                        text-align: right;
-                        background-color: #E5E7EB;
-                        padding: 0.5rem 0.75rem;
-                        border-radius: 0.5rem;
-                        margin-bottom: 0.3rem;
-                        display: inline-block;
-                        max-width: 100%;
-                        color: #1F2937;
-                    ">
-                        {msg["content"]}
-                    </div>
-                    """,
-                    unsafe_allow_html=True,
-                )
-            else:
-                st.markdown(
-                    f"""
-                    <div style="
-                        text-align: left;
-                        background-color: #ECFEFF;
-                        border-left: 4px solid #0D9488;
-                        padding: 0.5rem 0.75rem;
-                        border-radius: 0.5rem;
-                        margin-bottom: 0.3rem;
-                        max-width: 100%;
-                        color: #1F2937;
-                    ">
-                        🧑‍⚕️ {msg["content"]}
-                    </div>
-                    """,
-                    unsafe_allow_html=True,
-                )
+            template = _USER_MSG_TMPL if msg["role"] == "user" else _ASSISTANT_MSG_TMPL
+            st.html(template % html.escape(msg["content"]))
     
     st.markdown("---")
     
@@ -575,29 +706,25 @@ def main():
                 )
     
     with col_output2:
-        # Diagnostic synthesis - Use Streamlit components instead of raw HTML for better rendering
+        # Diagnostic synthesis
         diff = report.get("differential_diagnosis") or []
         confidence = report.get("confidence_score")
 
-        st.markdown(
-            """
-            <div style="
-                background-color: #FFFFFF;
-                border-radius: 0.75rem;
-                padding: 1rem 1.25rem;
-                box-shadow: 0 1px 3px rgba(0,0,0,0.08);
-                margin-bottom: 0.75rem;
-                border: 1px solid #E5E7EB;
-            ">
-                <div style="font-weight: 600; margin-bottom: 0.75rem; color: #0F172A; font-size: 1rem;">
-                    📌 Final Diagnosis & Priority
-                </div>
-            """,
-            unsafe_allow_html=True,
-        )
+        # The whole panel (header, diagnoses, confidence) goes out as one st.html
+        # call: a wrapper div split across several calls never actually wraps
+        # anything, and each call is a separate frontend element
+        panel_html = [
+            '<div style="background-color: #FFFFFF; border-radius: 0.75rem; padding: 1rem 1.25rem; '
+            'box-shadow: 0 1px 3px rgba(0,0,0,0.08); margin-bottom: 0.75rem; border: 1px solid #E5E7EB;">'
+            '<div style="font-weight: 600; margin-bottom: 0.75rem; color: #0F172A; font-size: 1rem;">'
+            '📌 Final Diagnosis & Priority'
+            '</div>'
+        ]
         
         if diff:
-            st.markdown("**Top Differential Diagnoses:**")
+            panel_html.append(
+                '<div style="font-weight: 600; color: #0F172A; margin-bottom: 0.5rem;">Top Differential Diagnoses:</div>'
+            )
             
             for idx, d in enumerate(diff, start=1):
                 # Handle both string and dict formats
@@ -621,64 +748,36 @@ def main():
                             diagnosis = "Diagnosis details unavailable"
                     reasoning = d.get("reasoning", d.get("reason", ""))
                     
-                    # Use Streamlit container for each diagnosis card
                     # Escape HTML in diagnosis and reasoning to prevent raw HTML display
                     diagnosis_escaped = html.escape(str(diagnosis)) if diagnosis else "Unknown"
                     reasoning_escaped = html.escape(str(reasoning)) if reasoning else ""
                     
-                    with st.container():
-                        st.markdown(
-                            f"""
-                            <div style="
-                                background-color: #F9FAFB;
-                                padding: 0.75rem;
-                                border-radius: 0.5rem;
-                                border-left: 3px solid #0D9488;
-                                margin-bottom: 0.75rem;
-                            ">
-                                <div style="font-weight: 600; color: #0F172A; margin-bottom: 0.4rem;">
-                                    {idx}. {diagnosis_escaped}
-                                </div>
-                            </div>
-                            """,
-                            unsafe_allow_html=True,
+                    panel_html.append(
+                        '<div style="background-color: #F9FAFB; padding: 0.75rem; border-radius: 0.5rem; '
+                        'border-left: 3px solid #0D9488; margin-bottom: 0.75rem;">'
+                        '<div style="font-weight: 600; color: #0F172A; margin-bottom: 0.4rem;">'
+                        f'{idx}. {diagnosis_escaped}'
+                        '</div></div>'
+                    )
+                    if reasoning_escaped:
+                        panel_html.append(
+                            '<div style="color: #4B5563; font-size: 0.9rem; line-height: 1.5; '
+                            'margin-left: 0.5rem; margin-bottom: 0.75rem;">'
+                            f'{reasoning_escaped}'
+                            '</div>'
                         )
-                        if reasoning_escaped:
-                            st.markdown(
-                                f"""
-                                <div style="
-                                    color: #4B5563;
-                                    font-size: 0.9rem;
-                                    line-height: 1.5;
-                                    margin-left: 0.5rem;
-                                    margin-bottom: 0.75rem;
-                                ">
-                                    {reasoning_escaped}
-                                </div>
-                                """,
-                                unsafe_allow_html=True,
-                            )
                 elif isinstance(d, str):
                     # Escape HTML in string diagnosis
                     d_escaped = html.escape(d)
-                    st.markdown(
-                        f"""
-                        <div style="
-                            background-color: #F9FAFB;
-                            padding: 0.75rem;
-                            border-radius: 0.5rem;
-                            border-left: 3px solid #0D9488;
-                            margin-bottom: 0.75rem;
-                        ">
-                            <div style="font-weight: 600; color: #0F172A;">
-                                {idx}. {d_escaped}
-                            </div>
-                        </div>
-                        """,
-                        unsafe_allow_html=True,
+                    panel_html.append(
+                        '<div style="background-color: #F9FAFB; padding: 0.75rem; border-radius: 0.5rem; '
+                        'border-left: 3px solid #0D9488; margin-bottom: 0.75rem;">'
+                        '<div style="font-weight: 600; color: #0F172A;">'
+                        f'{idx}. {d_escaped}'
+                        '</div></div>'
                     )
         else:
-            st.markdown("<div style='color: #6B7280;'>No diagnosis available yet.</div>", unsafe_allow_html=True)
+            panel_html.append("<div style='color: #6B7280;'>No diagnosis available yet.</div>")
         
         if confidence is not None:
             # Format confidence as percentage with color coding
@@ -690,54 +789,25 @@ def main():
             else:
                 conf_color = "#DC2626"  # Red
             
-            st.markdown("---")
-            st.markdown(
-                f"""
-                <div style="margin-top: 0.5rem;">
-                    <strong style='color: #0F172A;'>Confidence Score:</strong> 
-                    <span style='color: {conf_color}; font-weight: 600; font-size: 1.1em;'>{confidence_pct:.1f}%</span>
-                </div>
-                """,
-                unsafe_allow_html=True,
+            panel_html.append(
+                '<hr style="margin: 0.75rem 0; border: none; border-top: 1px solid #E5E7EB;"/>'
+                '<div style="margin-top: 0.5rem;">'
+                "<strong style='color: #0F172A;'>Confidence Score:</strong> "
+                f"<span style='color: {conf_color}; font-weight: 600; font-size: 1.1em;'>{confidence_pct:.1f}%</span>"
+                '</div>'
             )
         
-        st.markdown("</div>", unsafe_allow_html=True)
+        panel_html.append("</div>")
+        st.html("".join(panel_html))
 
         # Evidence summary - Enhanced with expander for cleaner presentation
+        # (falls back to the joined diagnosis reasoning, filled in when the report arrived)
         evidence_summary = report.get("evidence_summary") or ""
         
-        # Also try to extract reasoning from differential_diagnosis if evidence_summary is empty
-        if not evidence_summary and diff:
-            # Combine reasoning from all diagnoses
-            reasoning_parts = []
-            for d in diff:
-                if isinstance(d, dict):
-                    reasoning = d.get("reasoning", d.get("reason", ""))
-                    if reasoning:
-                        reasoning_parts.append(reasoning)
-            if reasoning_parts:
-                evidence_summary = " ".join(reasoning_parts)
-        
         with st.expander("🧬 Deep Thinking Trace (Explainability)", expanded=True):
             if evidence_summary:
                 # Escape HTML in evidence summary to prevent raw HTML display
-                evidence_escaped = html.escape(str(evidence_summary))
-                st.markdown(
-                    f"""
-                    <div style="
-                        background-color: #F9FAFB;
-                        padding: 1rem;
-                        border-radius: 0.5rem;
-                        border-left: 4px solid #0D9488;
-                        font-size: 0.9rem;
-                        line-height: 1.6;
-                        color: #1F2937;
-                    ">
-                        {evidence_escaped}
-                    </div>
-                    """,
-                    unsafe_allow_html=True,
-                )
+                st.html(_EVIDENCE_TMPL % html.escape(str(evidence_summary)))
             else:
                 st.info("The agent's cross-modal reasoning trace will appear here once a diagnosis is generated.")
     
@@ -1,20 +1,30 @@
+import functools
 import os
-from typing import Final
+from typing import Any, Final, Literal
 
 from google import genai
 from google.genai import types
+from pydantic import BaseModel, ConfigDict, TypeAdapter
 
 
 # Using Gemini 2.5 Pro for advanced reasoning and multimodal capabilities
 MODEL_NAME: Final = "gemini-2.5-flash"
 
+# The final turn is constrained by response_schema, so the model's JSON is
+# valid without post-processing. The hand-rolled repair of malformed free-text
+# JSON is kept only for models without reliable structured output
+# (opt in with MCTA_LEGACY_JSON_REPAIR=1).
+LEGACY_JSON_REPAIR: Final = os.getenv("MCTA_LEGACY_JSON_REPAIR", "").strip().lower() in ("1", "true", "yes")
 
+
+@functools.lru_cache(maxsize=1)
 def get_gemini_client() -> genai.Client:
     """
     Initialize and return a Gemini client.
 
     Expects GEMINI_API_KEY to be configured in the environment
-    per google-genai library requirements.
+    per google-genai library requirements. The client is built once per
+    process and shared, so every call reuses the same HTTP connection pool.
     """
     # The google-genai client reads configuration from the environment,
     # so we only need to construct the client here.
@@ -50,7 +60,7 @@ DIAGNOSTIC_REPORT_SCHEMA: Final = types.Schema(
             type=types.Type.OBJECT,
             description=(
                 "Contains results from the function calls "
-                "(risk score, visualization base64)."
+                "(risk score, visualization SVG)."
             ),
             properties={
                 "sepsis_risk": types.Schema(
@@ -70,13 +80,13 @@ DIAGNOSTIC_REPORT_SCHEMA: Final = types.Schema(
                 "visualization_base64": types.Schema(
                     type=types.Type.STRING,
                     description=(
-                        "Base64-encoded PNG image string from "
+                        "Inline SVG markup from "
                         "generate_vitals_visualization function call."
                     ),
                 ),
                 "base64_image": types.Schema(
                     type=types.Type.STRING,
-                    description="Alternative key for visualization base64 image.",
+                    description="Alternative key for the visualization SVG markup.",
                 ),
             },
         ),
@@ -84,6 +94,80 @@ DIAGNOSTIC_REPORT_SCHEMA: Final = types.Schema(
 )
 
 
+def _to_json_schema(schema: dict) -> dict:
+    """Convert a Gemini schema dict (upper-case type names) to standard JSON Schema."""
+    out = dict(schema)
+    if "type" in out:
+        out["type"] = str(out["type"]).lower()
+    if "properties" in out:
+        out["properties"] = {k: _to_json_schema(v) for k, v in out["properties"].items()}
+    if "items" in out:
+        out["items"] = _to_json_schema(out["items"])
+    return out
+
+
+# Client-side check of parsed reports, compiled once to a plain Python function
+# (optional dependency; without it reports are used unvalidated, as before)
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+_REPORT_VALIDATOR = (
+    fastjsonschema.compile(_to_json_schema(DIAGNOSTIC_REPORT_SCHEMA.to_json_dict()))
+    if fastjsonschema is not None
+    else None
+)
+
+
+def report_schema_errors(report: dict) -> list[str]:
+    """
+    Validate a parsed diagnostic report against DIAGNOSTIC_REPORT_SCHEMA.
+
+    Returns a list of validation messages (empty if the report conforms or
+    fastjsonschema is not installed).
+    """
+    if _REPORT_VALIDATOR is None:
+        return []
+    try:
+        _REPORT_VALIDATOR(report)
+    except fastjsonschema.JsonSchemaException as e:
+        return [e.message]
+    return []
+
+
+class DiagnosticReport(BaseModel):
+    """
+    Typed mirror of DIAGNOSTIC_REPORT_SCHEMA. Like the schema, every field is
+    optional; keys outside it are kept.
+    """
+
+    model_config = ConfigDict(extra="allow")
+
+    differential_diagnosis: list[str] | None = None
+    triage_urgency: Literal["RED", "YELLOW", "GREEN"] | None = None
+    confidence_score: float | None = None
+    evidence_summary: str | None = None
+    tool_verification_data: dict[str, Any] | None = None
+
+
+# pydantic ships with google-genai; its Rust JSON parser decodes and
+# type-checks a report in a single pass
+_REPORT_ADAPTER = TypeAdapter(DiagnosticReport)
+
+
+def validate_report_json(json_text: str | bytes) -> dict:
+    """
+    Parse a diagnostic report from JSON text and check it against
+    DiagnosticReport in one pass.
+
+    Returns the report as a plain dict holding only the keys present in the
+    text. Raises pydantic.ValidationError if the text is not JSON or
+    does not match the schema.
+    """
+    return _REPORT_ADAPTER.validate_json(json_text).model_dump(exclude_unset=True)
+
+
 SENIOR_TRIAGE_SYSTEM_INSTRUCTION: Final = """
 You are MCTA, a Senior Clinical Triage Specialist operating in an emergency setting.
 
@@ -100,7 +184,7 @@ Core behaviors:
   lactate from lab data, and blood pressure from patient notes or vitals.
 - CRITICAL: You MUST ALWAYS call generate_vitals_visualization if you have ANY time-series vitals data 
   (even just 2 data points). Convert the vitals list to a JSON string and pass it to the tool. 
-  This is mandatory for visual trend confirmation. You must integrate the resulting chart base64 string 
+  This is mandatory for visual trend confirmation. You must integrate the resulting chart SVG markup 
   into the tool_verification_data.visualization_base64 field of your JSON response.
 - These tool calls are MANDATORY and NON-NEGOTIABLE. Do not skip them. Always call both tools when data is available.
 - Be conservative in life-threatening scenarios: if in doubt between categories, err toward RED.
@@ -109,7 +193,7 @@ Output contract:
 - You MUST return a single JSON object that strictly follows DIAGNOSTIC_REPORT_SCHEMA.
 - Do not include any extra keys or unstructured narrative outside this JSON.
 - The tool_verification_data field must include both the sepsis risk score (if calculated) and 
-  the visualization base64 string (if generated) under appropriate keys.
+  the visualization SVG markup (if generated) under appropriate keys.
 """.strip()
 
 
@@ -124,9 +208,18 @@ DATA_EXTRACTION_SCHEMA: Final = types.Schema(
         ),
         "vitals": types.Schema(
             type=types.Type.ARRAY,
-            description="Extracted time-series vitals data",
+            description=(
+                "Extracted time-series vitals data, one item per time point "
+                "(at most 288, e.g. a reading every 5 minutes over a day). "
+                "Omit SpO2 or HeartRate for a time point where the chart does not show it."
+            ),
+            # Generous bound on the array; only "time" is required because a
+            # chart may show just one of the two vitals (downstream code handles
+            # missing values; requiring both would make the model invent one)
+            max_items=288,
             items=types.Schema(
                 type=types.Type.OBJECT,
+                required=["time"],
                 properties={
                     "time": types.Schema(
                         type=types.Type.STRING,
@@ -144,4 +237,65 @@ DATA_EXTRACTION_SCHEMA: Final = types.Schema(
             ),
         ),
     },
-)
\ No newline at end of file
+)
+
+# Single-request image analysis (extract_data_from_images): the free-text
+# analysis and the structured labs/vitals come back together. Labs are a list
+# of name/value pairs because an OBJECT schema needs fixed property names.
+IMAGE_ANALYSIS_SCHEMA: Final = types.Schema(
+    type=types.Type.OBJECT,
+    required=["analysis_text"],
+    properties={
+        "analysis_text": types.Schema(
+            type=types.Type.STRING,
+            description="Comprehensive analysis of the image(s): findings, measurements, annotations and every numerical value visible.",
+        ),
+        "labs": types.Schema(
+            type=types.Type.ARRAY,
+            description="Every lab value shown, with its exact name/abbreviation as printed. Empty if the image has no lab values (e.g. an X-ray).",
+            # A NUMBER-only value would coerce or drop results such as "<0.01"
+            # or "positive", so those go in text_value instead
+            items=types.Schema(
+                type=types.Type.OBJECT,
+                required=["name"],
+                properties={
+                    "name": types.Schema(type=types.Type.STRING, description="Lab name or abbreviation (e.g., 'WBC', 'Lactate')"),
+                    "value": types.Schema(type=types.Type.NUMBER, description="Numerical value, when the result is a plain number"),
+                    "text_value": types.Schema(
+                        type=types.Type.STRING,
+                        description="The result exactly as printed when it is not a plain number (e.g., '<0.01', 'positive'); omit otherwise",
+                    ),
+                },
+            ),
+        ),
+        "vitals": DATA_EXTRACTION_SCHEMA.properties["vitals"],
+    },
+)
+
+
+# Fixed instructions of the single-call fast path (utils._generate_report_fast).
+# They are sent before any patient data, so the prompt prefix is identical
+# across patients and can be reused by Gemini's implicit caching.
+FAST_REPORT_INSTRUCTION: Final = """You are a senior medical triage expert. Analyze the patient data that follows and provide a comprehensive diagnostic report.
+
+CRITICAL: Only use data that is explicitly provided in the patient data. Do NOT assume or infer lab values, vitals, or other clinical data that is not present. Focus your analysis on:
+- Patient notes (if provided)
+- Image analysis findings (if provided)
+- Lab values that are explicitly listed (do not mention values not in the list)
+- Vitals measurements that are explicitly listed (do not mention measurements not in the list)
+
+Provide a JSON report with:
+1. "differential_diagnosis": Array of 3-4 top diagnoses (strings) based ONLY on available data
+2. "triage_urgency": "RED", "YELLOW", or "GREEN" based on available information
+3. "confidence_score": Number 0.0-1.0 reflecting confidence given available data
+4. "evidence_summary": Concise reasoning summary based ONLY on provided data
+5. "tool_verification_data": {
+    "sepsis_risk": {
+        "risk_score": <number 0-30>,
+        "score_category": "High Risk" or "Low Risk"
+    }
+}
+
+For risk_score: Only use lab values and vitals that are explicitly provided. If lab values or vitals are not available, base the risk score on patient notes and image analysis findings only.
+
+Return ONLY valid JSON, no explanation."""
@@ -1,17 +1,20 @@
 from __future__ import annotations
 
+import bisect
 from dataclasses import dataclass
-from typing import List
+from typing import Any, Dict, List, Sequence, Tuple
 
+import numpy as np
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class LabPanel:
     wbc: float  # x10^9/L
     lactate: float  # mmol/L
     creatinine: float  # mg/dL
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class VitalPoint:
     time: str  # human-readable time label
     spo2: float
@@ -19,103 +22,158 @@ class VitalPoint:
     respiratory_rate: int
 
 
-def summarize_labs(panel: LabPanel) -> str:
+# Threshold tables for summarize_labs: bisect_right over the ascending cut-offs
+# gives the index of the matching message (a value equal to a cut-off falls
+# into the higher band, same as the ">=" checks they replace).
+_WBC_BINS = (11, 18)
+_WBC_MSGS = (
+    "within normal range.",
+    "elevated, possible infection or stress.",
+    "critically high, suggests severe infection.",
+)
+_LACTATE_BINS = (2, 4)
+_LACTATE_MSGS = (
+    "within normal range.",
+    "mildly elevated, may indicate early hypoperfusion.",
+    "markedly elevated, concerning for tissue hypoperfusion.",
+)
+_CREATININE_BINS = (1.3, 2)
+_CREATININE_MSGS = (
+    "within normal range.",
+    "mildly elevated, possible renal dysfunction.",
+    "significantly elevated, suggests acute kidney injury.",
+)
+
+
+@dataclass
+class VitalsSeries:
     """
-    Convert raw lab values into a concise, clinically flavored summary.
+    Vitals time-series stored column-wise (one array per measurement).
+
+    Keeping each measurement in its own contiguous float buffer lets trend
+    statistics (deltas, slopes) run as NumPy operations instead of attribute
+    lookups on one VitalPoint object per reading.
     """
-    statements = []
-
-    # WBC
-    if panel.wbc >= 18:
-        statements.append(f"WBC {panel.wbc} - critically high, suggests severe infection.")
-    elif panel.wbc >= 11:
-        statements.append(f"WBC {panel.wbc} - elevated, possible infection or stress.")
-    else:
-        statements.append(f"WBC {panel.wbc} - within normal range.")
-
-    # Lactate
-    if panel.lactate >= 4:
-        statements.append(
-            f"Lactate {panel.lactate} - markedly elevated, concerning for tissue hypoperfusion."
-        )
-    elif panel.lactate >= 2:
-        statements.append(
-            f"Lactate {panel.lactate} - mildly elevated, may indicate early hypoperfusion."
-        )
-    else:
-        statements.append(f"Lactate {panel.lactate} - within normal range.")
 
-    # Creatinine
-    if panel.creatinine >= 2:
-        statements.append(
-            f"Creatinine {panel.creatinine} - significantly elevated, suggests acute kidney injury."
+    time: List[str]  # human-readable time labels
+    spo2: np.ndarray
+    heart_rate: np.ndarray
+    respiratory_rate: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    @classmethod
+    def from_points(cls, points: Sequence[VitalPoint]) -> VitalsSeries:
+        n = len(points)
+        return cls(
+            time=[p.time for p in points],
+            spo2=np.fromiter((p.spo2 for p in points), dtype=float, count=n),
+            heart_rate=np.fromiter((p.heart_rate for p in points), dtype=float, count=n),
+            respiratory_rate=np.fromiter((p.respiratory_rate for p in points), dtype=float, count=n),
         )
-    elif panel.creatinine >= 1.3:
-        statements.append(
-            f"Creatinine {panel.creatinine} - mildly elevated, possible renal dysfunction."
+
+    @classmethod
+    def from_json(cls, data: List[Dict[str, Any]]) -> VitalsSeries:
+        """
+        Build a series from the app's vitals JSON shape
+        ({"time", "SpO2", "HeartRate", optional "RespiratoryRate"}).
+        """
+        n = len(data)
+
+        def column(key: str) -> np.ndarray:
+            # Missing and null readings both become NaN (float(None) would raise)
+            return np.fromiter(
+                (np.nan if (x := d.get(key)) is None else x for d in data), dtype=float, count=n
+            )
+
+        return cls(
+            time=[str(d.get("time", "")) for d in data],
+            spo2=column("SpO2"),
+            heart_rate=column("HeartRate"),
+            respiratory_rate=column("RespiratoryRate"),
         )
-    else:
-        statements.append(f"Creatinine {panel.creatinine} - within normal range.")
+
+
+def summarize_labs(panel: LabPanel) -> str:
+    """
+    Convert raw lab values into a concise, clinically flavored summary.
+    """
+    statements = [
+        f"WBC {panel.wbc} - {_WBC_MSGS[bisect.bisect_right(_WBC_BINS, panel.wbc)]}",
+        f"Lactate {panel.lactate} - {_LACTATE_MSGS[bisect.bisect_right(_LACTATE_BINS, panel.lactate)]}",
+        f"Creatinine {panel.creatinine} - "
+        f"{_CREATININE_MSGS[bisect.bisect_right(_CREATININE_BINS, panel.creatinine)]}",
+    ]
 
     return " ".join(statements)
 
 
-def summarize_vitals_trend(points: List[VitalPoint]) -> str:
+def summarize_vitals_trend(points: Sequence[VitalPoint] | VitalsSeries) -> str:
     """
     Convert a series of vitals into a high-level narrative about trends.
     """
-    if not points:
+    series = points if isinstance(points, VitalsSeries) else VitalsSeries.from_points(points)
+    n = len(series)
+    if not n:
         return "No vitals data available."
 
-    start, end = points[0], points[-1]
-
-    spo2_trend = _describe_trend(start.spo2, end.spo2, "SpO2")
-    hr_trend = _describe_trend(start.heart_rate, end.heart_rate, "heart rate")
+    spo2_trend = _describe_trend(series.spo2[0], series.spo2[-1], "SpO2")
+    hr_trend = _describe_trend(series.heart_rate[0], series.heart_rate[-1], "heart rate")
     rr_trend = _describe_trend(
-        start.respiratory_rate,
-        end.respiratory_rate,
+        series.respiratory_rate[0],
+        series.respiratory_rate[-1],
         "respiratory rate",
     )
 
-    return (
-        f"Over the observed period from {start.time} to {end.time}: "
+    summary = (
+        f"Over the observed period from {series.time[0]} to {series.time[-1]}: "
         f"{spo2_trend} {hr_trend} {rr_trend}"
     )
 
+    # With 3+ readings the least-squares slope says more than first vs last
+    if n >= 3 and not np.isnan(series.spo2).any():
+        slope = np.polyfit(np.arange(n), series.spo2, 1)[0]
+        summary += f"SpO2 is changing by {slope:+.1f} per reading on average."
+
+    return summary
+
+
+# Indexed by (abs(delta) >= 1) * (1 + (delta > 0)): 0 stable, 1 down, 2 up
+_TREND_DIRECTIONS = ("remained stable", "declined", "increased")
+
 
 def _describe_trend(start_value: float, end_value: float, label: str) -> str:
     delta = end_value - start_value
 
-    if abs(delta) < 1:
-        direction = "remained stable"
-    elif delta < 0:
-        direction = "declined"
-    else:
-        direction = "increased"
+    direction = _TREND_DIRECTIONS[(abs(delta) >= 1) * (1 + (delta > 0))]
 
     return (
         f"{label} {direction} from {start_value:.1f} to {end_value:.1f}. "
     )
 
 
+# Demo data is immutable (frozen dataclasses, tuple), so one shared instance
+# is handed out instead of rebuilding it on every call
+_MOCK_LAB_PANEL = LabPanel(wbc=18.5, lactate=4.8, creatinine=2.1)
+
+_MOCK_VITALS_SERIES = (
+    VitalPoint(time="T0", spo2=95, heart_rate=105, respiratory_rate=20),
+    VitalPoint(time="T30", spo2=92, heart_rate=112, respiratory_rate=24),
+    VitalPoint(time="T60", spo2=89, heart_rate=118, respiratory_rate=26),
+    VitalPoint(time="T90", spo2=88, heart_rate=122, respiratory_rate=28),
+)
+
+
 def mock_lab_panel() -> LabPanel:
     """
     Provide a mock LabPanel for demo purposes.
     """
-    return LabPanel(wbc=18.5, lactate=4.8, creatinine=2.1)
+    return _MOCK_LAB_PANEL
 
 
-def mock_vitals_series() -> List[VitalPoint]:
+def mock_vitals_series() -> Tuple[VitalPoint, ...]:
     """
     Provide mock vitals time-series data for demo purposes.
     """
-    return [
-        VitalPoint(time="T0", spo2=95, heart_rate=105, respiratory_rate=20),
-        VitalPoint(time="T30", spo2=92, heart_rate=112, respiratory_rate=24),
-        VitalPoint(time="T60", spo2=89, heart_rate=118, respiratory_rate=26),
-        VitalPoint(time="T90", spo2=88, heart_rate=122, respiratory_rate=28),
-    ]
-
-
-
-
+    return _MOCK_VITALS_SERIES
@@ -5,23 +5,28 @@ This module provides sample lab and vitals data in JSON format
 for testing the data abstraction layer.
 """
 
-import json
+from types import MappingProxyType
 
 # Default healthy/normal patient state (Green Triage) - Initial state of the app
-DEFAULT_LABS_JSON = {
+# The defaults are read-only views so no caller can mutate the shared module
+# state; get_default_data() hands out mutable copies.
+DEFAULT_LABS_JSON = MappingProxyType({
     "WBC_count": 7.5,  # Normal range: 4.0-11.0
     "Lactate_level": 1.2,  # Normal range: 0.5-2.2
     "Troponin": 0.01,  # Normal: <0.04
     "Hemoglobin": 14.5,  # Normal range: 12.0-16.0 (female) / 13.5-17.5 (male)
-}
+})
 
 # Default healthy vitals time-series data
-DEFAULT_VITALS_TIMESERIES_JSON = [
-    {"time": "00:00", "SpO2": 98, "HeartRate": 72},
-    {"time": "01:00", "SpO2": 98, "HeartRate": 70},
-    {"time": "02:00", "SpO2": 99, "HeartRate": 68},
-    {"time": "03:00", "SpO2": 98, "HeartRate": 70},
-]
+DEFAULT_VITALS_TIMESERIES_JSON = tuple(
+    MappingProxyType(v)
+    for v in (
+        {"time": "00:00", "SpO2": 98, "HeartRate": 72},
+        {"time": "01:00", "SpO2": 98, "HeartRate": 70},
+        {"time": "02:00", "SpO2": 99, "HeartRate": 68},
+        {"time": "03:00", "SpO2": 98, "HeartRate": 70},
+    )
+)
 
 # Legacy mock data (kept for backward compatibility if needed)
 MOCK_LABS_JSON = {
@@ -54,12 +59,15 @@ def get_default_data():
     """
     Return a dictionary containing default healthy patient data (Green Triage state).
     
+    The copies are plain dicts/lists: the app edits labs in place and the
+    vitals rows are later serialized to JSON, which read-only views can't be.
+    
     Returns:
         Dictionary with keys: labs, vitals
     """
     return {
-        "labs": DEFAULT_LABS_JSON.copy(),
-        "vitals": [v.copy() for v in DEFAULT_VITALS_TIMESERIES_JSON],
+        "labs": dict(DEFAULT_LABS_JSON),
+        "vitals": list(map(dict, DEFAULT_VITALS_TIMESERIES_JSON)),
     }
 
 
@@ -1,15 +1,93 @@
-import base64
-import io
+import functools
+import html
 import json
-from typing import Any, Dict, List
+from math import trunc
+from string import Template
+from typing import Any, Dict, List, Tuple
+
+try:
+    # orjson parses in C and is a faster drop-in for json.loads (optional dependency)
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
+
+# --- Vitals chart SVG template ---
+# The chart is a fixed layout (two y-axes, fixed SpO2 range), so everything
+# except the data-dependent pieces is baked into one template at import and
+# each render only formats the point coordinates and tick labels.
+_CHART_W, _CHART_H = 800, 400
+_PLOT_LEFT, _PLOT_RIGHT = 70, 730
+_PLOT_TOP, _PLOT_BOTTOM = 50, 330
+_PLOT_PAD = 30  # horizontal inset so the first/last points don't sit on the frame
+_SPO2_MIN, _SPO2_MAX = 80, 100
+_HR_TICKS = 5
+
+
+def _spo2_y(value: float) -> float:
+    # Clamped to the plot area, like the fixed 80-100 axis limits
+    frac = (min(max(value, _SPO2_MIN), _SPO2_MAX) - _SPO2_MIN) / (_SPO2_MAX - _SPO2_MIN)
+    return _PLOT_BOTTOM - frac * (_PLOT_BOTTOM - _PLOT_TOP)
+
+
+# Polyline styles; a series with missing readings is drawn as one polyline per
+# unbroken run of points, so gaps stay visible (as NaN gaps did in Matplotlib)
+_SPO2_LINE_ATTRS = 'fill="none" stroke="teal" stroke-width="2"'
+_HR_LINE_ATTRS = 'fill="none" stroke="orange" stroke-width="1.5" stroke-dasharray="6 4"'
+
+
+def _polylines(points: List[Tuple[float, float] | None], attrs: str) -> str:
+    """One <polyline> per run of consecutive non-None points."""
+    segments: List[List[Tuple[float, float]]] = [[]]
+    for point in points:
+        if point is None:
+            if segments[-1]:
+                segments.append([])
+        else:
+            segments[-1].append(point)
+    return "".join(
+        f'<polyline points="{" ".join(f"{x:.1f},{y:.1f}" for x, y in seg)}" {attrs}/>'
+        for seg in segments
+        if seg
+    )
+
 
-import matplotlib.pyplot as plt
+def _static_spo2_axis() -> str:
+    parts = []
+    for tick in range(_SPO2_MIN, _SPO2_MAX + 1, 5):
+        y = _spo2_y(tick)
+        parts.append(
+            f'<line x1="{_PLOT_LEFT}" y1="{y:.1f}" x2="{_PLOT_RIGHT}" y2="{y:.1f}" '
+            'stroke="#B0B0B0" stroke-dasharray="4 4" stroke-opacity="0.5"/>'
+            f'<text x="{_PLOT_LEFT - 8}" y="{y + 4:.1f}" text-anchor="end" fill="teal">{tick}</text>'
+        )
+    return "".join(parts)
+
+
+_CHART_SVG_TMPL = Template(
+    f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {_CHART_W} {_CHART_H}" '
+    f'width="{_CHART_W}" height="{_CHART_H}" font-family="DejaVu Sans, Arial, sans-serif" font-size="12">'
+    f'<rect width="{_CHART_W}" height="{_CHART_H}" fill="white"/>'
+    f'<text x="{(_PLOT_LEFT + _PLOT_RIGHT) / 2}" y="{_PLOT_TOP - 18}" text-anchor="middle" font-size="14">'
+    "Critical Vitals Trend Confirmation</text>"
+    + _static_spo2_axis()
+    + "${x_ticks}${hr_ticks}"
+    f'<rect x="{_PLOT_LEFT}" y="{_PLOT_TOP}" width="{_PLOT_RIGHT - _PLOT_LEFT}" '
+    f'height="{_PLOT_BOTTOM - _PLOT_TOP}" fill="none" stroke="#333333"/>'
+    "${spo2_lines}${spo2_markers}${hr_lines}${hr_markers}"
+    f'<text x="{(_PLOT_LEFT + _PLOT_RIGHT) / 2}" y="{_CHART_H - 20}" text-anchor="middle">Time (Hourly)</text>'
+    f'<text x="20" y="{(_PLOT_TOP + _PLOT_BOTTOM) / 2}" text-anchor="middle" fill="teal" '
+    f'transform="rotate(-90 20 {(_PLOT_TOP + _PLOT_BOTTOM) / 2})">SpO2 (%)</text>'
+    f'<text x="{_CHART_W - 20}" y="{(_PLOT_TOP + _PLOT_BOTTOM) / 2}" text-anchor="middle" fill="orange" '
+    f'transform="rotate(90 {_CHART_W - 20} {(_PLOT_TOP + _PLOT_BOTTOM) / 2})">Heart Rate (bpm)</text>'
+    "</svg>"
+)
 
 
 def generate_vitals_visualization(time_series_data: str) -> str:
     """
-    Executes Python code to plot time-series vitals (SpO2, HR)
-    for graphical analysis and returns the resulting PNG as a Base64 string.
+    Plots time-series vitals (SpO2, HR)
+    for graphical analysis and returns the resulting chart as inline SVG markup.
 
     The time_series_data argument is expected to be a JSON string encoding a list
     of objects with at least:
@@ -17,46 +95,75 @@ def generate_vitals_visualization(time_series_data: str) -> str:
       - "SpO2": float or int (capital S)
       - "HeartRate": int (capital H)
     """
+    # The agent is told to call this tool whenever vitals are present, so the
+    # same series is often re-rendered across turns and reruns; the chart is a
+    # pure function of the input string.
+    return _render_vitals_chart(time_series_data)
+
+
+@functools.lru_cache(maxsize=64)
+def _render_vitals_chart(time_series_data: str) -> str:
     # 1. Parse data (JSON string from agent request)
-    data: List[Dict[str, Any]] = json.loads(time_series_data)
+    data: List[Dict[str, Any]] = _json_loads(time_series_data)
 
     if not data:
         raise ValueError("time_series_data must contain at least one data point.")
 
-    # 2. Extract components
-    times = [d["time"] for d in data]
-    spo2 = [d["SpO2"] for d in data]
-    hr = [d["HeartRate"] for d in data]
-
-    # 3. Plot using Matplotlib (make it look professional)
-    fig, ax1 = plt.subplots(figsize=(8, 4))
-    
-    # SpO2 on primary axis
-    ax1.plot(times, spo2, label="SpO2 (%)", color="teal", marker="o", linewidth=2)
-    ax1.set_xlabel("Time (Hourly)")
-    ax1.set_ylabel("SpO2 (%)", color="teal")
-    ax1.tick_params(axis="y", labelcolor="teal")
-    ax1.set_ylim(80, 100)
-    ax1.grid(True, linestyle="--", alpha=0.5)
-
-    # Heart Rate on secondary axis
-    ax2 = ax1.twinx()
-    ax2.plot(
-        times, hr, label="Heart Rate (bpm)", color="orange", marker="x", linestyle="--"
+    # 2. Extract components (single pass over the points); a reading may lack
+    # SpO2 or HeartRate (None or absent), which leaves a gap in that series
+    times, spo2, hr = map(list, zip(*((d.get("time", ""), d.get("SpO2"), d.get("HeartRate")) for d in data)))
+
+    # 3. Scale the series into the plot area
+    n = len(times)
+    if n > 1:
+        step = (_PLOT_RIGHT - _PLOT_LEFT - 2 * _PLOT_PAD) / (n - 1)
+        xs = [_PLOT_LEFT + _PLOT_PAD + i * step for i in range(n)]
+    else:
+        xs = [(_PLOT_LEFT + _PLOT_RIGHT) / 2]
+
+    # Heart rate gets its own (right-hand) axis scaled to the data, with 10% headroom
+    # (a nominal 60-100 bpm range when the chart has no heart rate at all)
+    hr_values = [v for v in hr if v is not None]
+    hr_lo, hr_hi = (min(hr_values), max(hr_values)) if hr_values else (60, 100)
+    if hr_hi - hr_lo < 1:
+        hr_lo, hr_hi = hr_lo - 5, hr_hi + 5
+    hr_margin = (hr_hi - hr_lo) * 0.1
+    hr_lo, hr_hi = hr_lo - hr_margin, hr_hi + hr_margin
+    hr_scale = (_PLOT_BOTTOM - _PLOT_TOP) / (hr_hi - hr_lo)
+
+    spo2_pts = [None if v is None else (x, _spo2_y(v)) for x, v in zip(xs, spo2)]
+    hr_pts = [None if v is None else (x, _PLOT_BOTTOM - (v - hr_lo) * hr_scale) for x, v in zip(xs, hr)]
+
+    # 4. Fill the template; only the data-dependent fragments are built here
+    x_ticks = "".join(
+        f'<text x="{x:.1f}" y="{_PLOT_BOTTOM + 18}" text-anchor="middle">{html.escape(str(t))}</text>'
+        for x, t in zip(xs, times)
+    )
+    hr_ticks = "".join(
+        f'<text x="{_PLOT_RIGHT + 8}" y="{_PLOT_BOTTOM - i * (_PLOT_BOTTOM - _PLOT_TOP) / (_HR_TICKS - 1) + 4:.1f}" '
+        f'fill="orange">{hr_lo + i * (hr_hi - hr_lo) / (_HR_TICKS - 1):.0f}</text>'
+        for i in range(_HR_TICKS)
+    )
+    svg_markup = _CHART_SVG_TMPL.substitute(
+        x_ticks=x_ticks,
+        hr_ticks=hr_ticks,
+        spo2_lines=_polylines(spo2_pts, _SPO2_LINE_ATTRS),
+        spo2_markers="".join(
+            f'<circle cx="{x:.1f}" cy="{y:.1f}" r="4" fill="teal"/>' for x, y in filter(None, spo2_pts)
+        ),
+        hr_lines=_polylines(hr_pts, _HR_LINE_ATTRS),
+        hr_markers="".join(
+            f'<path d="M{x - 4:.1f},{y - 4:.1f}L{x + 4:.1f},{y + 4:.1f}M{x - 4:.1f},{y + 4:.1f}L{x + 4:.1f},{y - 4:.1f}" '
+            'stroke="orange" stroke-width="1.5"/>'
+            for x, y in filter(None, hr_pts)
+        ),
     )
-    ax2.set_ylabel("Heart Rate (bpm)", color="orange")
-    ax2.tick_params(axis="y", labelcolor="orange")
 
-    plt.title("Critical Vitals Trend Confirmation", fontsize=10)
-    fig.tight_layout()  # Adjust layout to prevent clipping
+    return svg_markup
 
-    # 4. Save plot to buffer and encode to Base64
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png", bbox_inches="tight")
-    plt.close(fig)  # Close figure to free memory
-    base64_image = base64.b64encode(buf.getvalue()).decode("utf-8")
 
-    return base64_image
+# Indexed by the bool "score >= 20"
+_SEPSIS_CATEGORIES = ("Low Risk", "High Risk")
 
 
 def calculate_sepsis_risk(
@@ -70,11 +177,9 @@ def calculate_sepsis_risk(
 
     This is NOT a real clinical tool and must not be used for real patient care.
     """
-    score = (heart_rate // 10) + (respiratory_rate // 5) + int(lactate_level * 3)
-
-    category = "High Risk" if score >= 20 else "Low Risk"
+    score = (heart_rate // 10) + (respiratory_rate // 5) + trunc(lactate_level * 3)
 
-    return {"risk_score": int(score), "score_category": category}
+    return {"risk_score": int(score), "score_category": _SEPSIS_CATEGORIES[score >= 20]}
 
 
 # Hour 5-6: Both tools enabled for autonomous agentic tool use
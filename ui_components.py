@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from string import Template
 from typing import Literal, Optional
 
 import streamlit as st
@@ -32,6 +33,132 @@ STATUS_COLORS = {
 }
 
 
+# Component styles, emitted once per page by render_styles(); the render
+# functions below then only ship small class-keyed markup.
+_STYLE_BLOCK = f"""
+<style>
+.mcta-badge {{
+    border-radius: 0.75rem;
+    padding: 1.75rem 2rem;
+    background-color: #6B7280;
+    color: white;
+    font-weight: 800;
+    font-size: 1.5rem;
+    text-align: center;
+    box-shadow: 0 20px 25px -5px rgba(0,0,0,0.15), 0 10px 10px -5px rgba(0,0,0,0.1);
+    margin-bottom: 1.5rem;
+    border: 2px solid rgba(255,255,255,0.2);
+}}
+.mcta-badge-red {{ background-color: {STATUS_COLORS["RED"]}; }}
+.mcta-badge-yellow {{ background-color: {STATUS_COLORS["YELLOW"]}; }}
+.mcta-badge-green {{ background-color: {STATUS_COLORS["GREEN"]}; }}
+.mcta-badge-icon {{ font-size: 2.5rem; margin-bottom: 0.5rem; }}
+.mcta-badge-label {{ font-size: 0.9rem; font-weight: 600; opacity: 0.95; margin-bottom: 0.3rem; }}
+.mcta-badge-value {{ font-size: 2rem; letter-spacing: 0.1em; }}
+.mcta-badge-empty {{
+    border-radius: 0.75rem;
+    padding: 1.5rem;
+    background-color: #F3F4F6;
+    color: #6B7280;
+    font-weight: 600;
+    font-size: 1.1rem;
+    text-align: center;
+    border: 2px dashed #D1D5DB;
+}}
+.mcta-badge-empty span {{ font-size: 0.9rem; font-weight: 400; }}
+.mcta-card {{
+    background-color: #FFFFFF;
+    border-radius: 0.75rem;
+    padding: 1rem 1.25rem;
+    box-shadow: 0 1px 3px rgba(0,0,0,0.08);
+    margin-bottom: 0.75rem;
+    border: 1px solid #E5E7EB;
+}}
+.mcta-card-title {{ font-weight: 600; margin-bottom: 0.5rem; color: #0F172A; }}
+.mcta-card-body {{ font-size: 0.9rem; color: #4B5563; white-space: pre-wrap; }}
+.mcta-tool-action {{
+    border-left: 4px solid;
+    border-radius: 0.5rem;
+    padding: 0.6rem 0.8rem;
+    font-family: ui-monospace, SFMono-Regular, Menlo, Monaco, Consolas, 'Liberation Mono', 'Courier New', monospace;
+    font-size: 0.85rem;
+    margin-bottom: 0.5rem;
+    box-shadow: 0 1px 2px rgba(0,0,0,0.05);
+}}
+.mcta-tool-action span {{ color: #1F2937; }}
+.mcta-tool-action-action {{ background-color: #FEF3C7; border-color: {STATUS_COLORS["AMBER_BORDER"]}; color: {STATUS_COLORS["AMBER_BORDER"]}; }}
+.mcta-tool-action-observation {{ background-color: #CCFBF1; border-color: {STATUS_COLORS["TEAL_BORDER"]}; color: {STATUS_COLORS["TEAL_BORDER"]}; }}
+.mcta-tool-action-error {{ background-color: #FEE2E2; border-color: {STATUS_COLORS["RED_BORDER"]}; color: {STATUS_COLORS["RED_BORDER"]}; }}
+.mcta-system-status {{
+    position: sticky;
+    top: 0;
+    z-index: 10;
+    background-color: #111827;
+    color: #A7F3D0;
+    padding: 0.6rem 0.8rem;
+    border-radius: 0.75rem;
+    margin-bottom: 0.75rem;
+    display: flex;
+    justify-content: center;
+    align-items: center;
+}}
+.mcta-system-status span {{ font-size: 0.9rem; color: #6EE7B7; font-weight: 600; }}
+</style>
+"""
+
+# Static markup is built once at import; per-call rendering only substitutes
+# the dynamic fields (Streamlit re-runs these on every interaction).
+_EMPTY_BADGE_HTML = (
+    '<div class="mcta-badge-empty">🩺 Triage Urgency<br/><span>No triage result yet.</span></div>'
+)
+
+_BADGE_TMPL = Template(
+    '<div class="mcta-badge ${badge_class}">'
+    '<div class="mcta-badge-icon">${icon}</div>'
+    '<div class="mcta-badge-label">TRIAGE URGENCY</div>'
+    '<div class="mcta-badge-value">${urgency}</div>'
+    "</div>"
+)
+
+_URGENCY_ICONS = {
+    "RED": "🚨",
+    "YELLOW": "⚠️",
+    "GREEN": "✅",
+}
+
+_CARD_TMPL = Template(
+    '<div class="mcta-card">'
+    '<div class="mcta-card-title">${icon} ${title}</div>'
+    '<div class="mcta-card-body">${body}</div>'
+    "</div>"
+)
+
+# Per-kind markup for render_tool_action; only the message is left to substitute
+_TOOL_ACTION_KIND_TMPLS = {
+    kind: Template(
+        f'<div class="mcta-tool-action mcta-tool-action-{kind.lower()}">'
+        f"<strong>{icon} [{kind}]</strong> "
+        "<span>${message}</span>"
+        "</div>"
+    )
+    for kind, icon in (("ACTION", "🔧"), ("OBSERVATION", "✅"), ("ERROR", "❌"))
+}
+
+_SYSTEM_STATUS_HTML = (
+    '<div class="mcta-system-status"><span>MCTA · Multimodal Clinical Triage Agent</span></div>'
+)
+
+
+def render_styles() -> None:
+    """
+    Emit the shared component stylesheet.
+
+    Call once per script run, before any other render_* function (elements
+    not re-emitted on a rerun are removed, so this can't be skipped on reruns).
+    """
+    st.html(_STYLE_BLOCK)
+
+
 def render_triage_badge(urgency: Optional[str]) -> None:
     """
     Render a large, visually dominating triage urgency badge.
@@ -40,85 +167,21 @@ def render_triage_badge(urgency: Optional[str]) -> None:
     prominent color coding, and professional styling.
     """
     if not urgency:
-        st.markdown(
-            """
-            <div style="
-                border-radius: 0.75rem;
-                padding: 1.5rem;
-                background-color: #F3F4F6;
-                color: #6B7280;
-                font-weight: 600;
-                font-size: 1.1rem;
-                text-align: center;
-                border: 2px dashed #D1D5DB;
-            ">
-                🩺 Triage Urgency<br/>
-                <span style="font-size: 0.9rem; font-weight: 400;">No triage result yet.</span>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
+        st.html(_EMPTY_BADGE_HTML)
         return
 
     urgency = urgency.upper()
-    color = STATUS_COLORS.get(urgency, "#6B7280")
+    # Unknown urgencies keep the grey .mcta-badge default
+    badge_class = f"mcta-badge-{urgency.lower()}" if urgency in _URGENCY_ICONS else ""
     
     # Determine icon based on urgency
-    icon_map = {
-        "RED": "🚨",
-        "YELLOW": "⚠️",
-        "GREEN": "✅",
-    }
-    icon = icon_map.get(urgency, "🩺")
-
-    st.markdown(
-        f"""
-        <div style="
-            border-radius: 0.75rem;
-            padding: 1.75rem 2rem;
-            background-color: {color};
-            color: white;
-            font-weight: 800;
-            font-size: 1.5rem;
-            text-align: center;
-            box-shadow: 0 20px 25px -5px rgba(0,0,0,0.15), 0 10px 10px -5px rgba(0,0,0,0.1);
-            margin-bottom: 1.5rem;
-            border: 2px solid rgba(255,255,255,0.2);
-        ">
-            <div style="font-size: 2.5rem; margin-bottom: 0.5rem;">{icon}</div>
-            <div style="font-size: 0.9rem; font-weight: 600; opacity: 0.95; margin-bottom: 0.3rem;">
-                TRIAGE URGENCY
-            </div>
-            <div style="font-size: 2rem; letter-spacing: 0.1em;">
-                {urgency}
-            </div>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
+    icon = _URGENCY_ICONS.get(urgency, "🩺")
+
+    st.html(_BADGE_TMPL.substitute(badge_class=badge_class, icon=icon, urgency=urgency))
 
 
 def render_card(title: str, body: str, icon: str = "") -> None:
-    st.markdown(
-        f"""
-        <div style="
-            background-color: #FFFFFF;
-            border-radius: 0.75rem;
-            padding: 1rem 1.25rem;
-            box-shadow: 0 1px 3px rgba(0,0,0,0.08);
-            margin-bottom: 0.75rem;
-            border: 1px solid #E5E7EB;
-        ">
-            <div style="font-weight: 600; margin-bottom: 0.5rem; color: #0F172A;">
-                {icon} {title}
-            </div>
-            <div style="font-size: 0.9rem; color: #4B5563; white-space: pre-wrap;">
-                {body}
-            </div>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
+    st.html(_CARD_TMPL.substitute(icon=icon, title=title, body=body))
 
 
 def render_tool_action(message: str, kind: Literal["ACTION", "OBSERVATION", "ERROR"] = "ACTION"):
@@ -129,64 +192,10 @@ def render_tool_action(message: str, kind: Literal["ACTION", "OBSERVATION", "ERR
     - OBSERVATION: Teal border (Host Execution Result)
     - ERROR: Red border (Error/Failure)
     """
-    if kind == "ACTION":
-        bg = "#FEF3C7"  # Amber-100
-        border_color = STATUS_COLORS["AMBER_BORDER"]
-        prefix = "[ACTION]"
-        icon = "🔧"
-    elif kind == "OBSERVATION":
-        bg = "#CCFBF1"  # Teal-100
-        border_color = STATUS_COLORS["TEAL_BORDER"]
-        prefix = "[OBSERVATION]"
-        icon = "✅"
-    else:  # ERROR
-        bg = "#FEE2E2"  # Red-100
-        border_color = STATUS_COLORS["RED_BORDER"]
-        prefix = "[ERROR]"
-        icon = "❌"
-
-    st.markdown(
-        f"""
-        <div style="
-            background-color: {bg};
-            border-left: 4px solid {border_color};
-            border-radius: 0.5rem;
-            padding: 0.6rem 0.8rem;
-            font-family: ui-monospace, SFMono-Regular, Menlo, Monaco, Consolas, 'Liberation Mono', 'Courier New', monospace;
-            font-size: 0.85rem;
-            margin-bottom: 0.5rem;
-            box-shadow: 0 1px 2px rgba(0,0,0,0.05);
-        ">
-            <strong style="color: {border_color};">{icon} {prefix}</strong> 
-            <span style="color: #1F2937;">{message}</span>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
+    tmpl = _TOOL_ACTION_KIND_TMPLS.get(kind, _TOOL_ACTION_KIND_TMPLS["ERROR"])
+    st.html(tmpl.substitute(message=message))
 
 
 def render_system_status() -> None:
     """Render system status header."""
-    st.markdown(
-        """
-        <div style="
-            position: sticky;
-            top: 0;
-            z-index: 10;
-            background-color: #111827;
-            color: #A7F3D0;
-            padding: 0.6rem 0.8rem;
-            border-radius: 0.75rem;
-            margin-bottom: 0.75rem;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-        ">
-            <span style="font-size: 0.9rem; color: #6EE7B7; font-weight: 600;">MCTA · Multimodal Clinical Triage Agent</span>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
-
-
-
+    st.html(_SYSTEM_STATUS_HTML)